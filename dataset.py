@@ -1,9 +1,14 @@
 import torch
 from torch.utils.data import Dataset, DataLoader
 import os
+import gc
 import glob
+import math
 import numpy as np
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import tempfile
 
 def read_kurucz_model(file_path):
     """
@@ -134,29 +139,21 @@ def read_kurucz_model(file_path):
         target_columns = ['RHOX', 'T', 'P', 'XNE', 'ABROSS', 'ACCRAD', 'VTURB']
         
         # The READ DECK6 line specifies 7 columns, but 
-        # the data rows might contain additional values (extra columns)
-        
-        # Read atmospheric structure data
-        for _ in range(num_depth_points):
-            line = f.readline()
-            values = list(map(float, line.strip().split()))
-            
-            # The first 7 values correspond to RHOX,T,P,XNE,ABROSS,ACCRAD,VTURB
-            # regardless of how many extra columns there are
-            if len(values) >= 7:
-                model['RHOX'].append(values[0])
-                model['T'].append(values[1])
-                model['P'].append(values[2])
-                model['XNE'].append(values[3])
-                model['ABROSS'].append(values[4])
-                model['ACCRAD'].append(values[5])
-                model['VTURB'].append(values[6])
-                
-                # Store any extra columns as a list
-                if len(values) > 7:
-                    if 'extra_columns' not in model:
-                        model['extra_columns'] = []
-                    model['extra_columns'].append(values[7:])
+        # the data rows might contain additional values (extra columns).
+        # Parse the whole depth-point table with NumPy's C reader instead of line by line
+        table = np.loadtxt(f, max_rows=num_depth_points, ndmin=2)
+        if table.shape[1] < len(target_columns):
+            raise ValueError(f"Expected at least {len(target_columns)} columns in READ DECK6 table, "
+                             f"got {table.shape[1]}")
+        
+        # The first 7 values correspond to RHOX,T,P,XNE,ABROSS,ACCRAD,VTURB
+        # regardless of how many extra columns there are
+        for i, column in enumerate(target_columns):
+            model[column] = table[:, i]
+        
+        # Store any extra columns as an array
+        if table.shape[1] > len(target_columns):
+            model['extra_columns'] = table[:, len(target_columns):]
     
     # Calculate [Fe/H] from iron abundance
     if fe_abundance is not None:
@@ -176,6 +173,176 @@ def read_kurucz_model(file_path):
     return model
 
 
+# Base conversion factors, folded into the normalization coefficients of log-scaled parameters
+_LN10 = math.log(10.0)
+_LOG10_E = 1.0 / _LN10
+
+
+def _add_affine_terms(params):
+    """
+    Cache the affine coefficients used by normalize/denormalize in a norm_params entry.
+    
+    normalize computes transformed * inv_range + shift and denormalize computes
+    normalized * scale + offset, so neither has to recompute (max - min) or divide per call.
+    For log-scaled parameters the log10 <-> ln conversion is folded in as well ('ln_inv_range',
+    'ln_scale', 'ln_offset'), so log10(x) and 10**x become a plain log/exp plus one multiply-add.
+    
+    Parameters:
+        params (dict): Normalization entry with 'min', 'max' and 'log_scale'
+        
+    Returns:
+        dict: The same entry with the affine coefficients filled in
+    """
+    params['scale'] = (params['max'] - params['min']) / 2.0
+    params['inv_range'] = 1.0 / params['scale']
+    params['shift'] = -1.0 - params['min'] * params['inv_range']
+    params['offset'] = params['min'] + params['scale']
+    if params['log_scale']:
+        params['ln_inv_range'] = params['inv_range'] * _LOG10_E
+        params['ln_scale'] = params['scale'] * _LN10
+        params['ln_offset'] = params['offset'] * _LN10
+    return params
+
+
+def _pad_into(dst, values):
+    """
+    Copy a depth profile into a preallocated row, truncating or padding with its last value.
+    
+    Parameters:
+        dst (np.ndarray): Destination row of length max_depth_points
+        values (array-like): Depth profile to copy
+    """
+    n = min(len(values), dst.size)
+    dst[:n] = values[:n]
+    dst[n:] = values[n - 1]
+
+
+# Depth profiles gathered per model: RHOX, T, P, XNE, ABROSS, ACCRAD, TAU
+PROFILE_KEYS = ['RHOX', 'T', 'P', 'XNE', 'ABROSS', 'ACCRAD', 'TAU']
+
+
+def _load_one(file_path, row, num_models, depth, shm_name=None, memmap_path=None):
+    """
+    Read a single model file, precompute its optical depth and write its padded
+    depth profiles into the shared profile buffer.
+    
+    Defined at module level so it can be pickled into ProcessPoolExecutor workers.
+    Only the small header dict travels back to the parent; the profiles are written
+    in place to row `row` of the (len(PROFILE_KEYS), num_models, depth) float32 array
+    backed by the shared-memory block `shm_name`, or by the file `memmap_path`.
+    
+    Returns:
+        dict or None: The parsed model without its depth profiles, or None if the file could not be loaded
+    """
+    try:
+        model = read_kurucz_model(file_path)
+        # Calculate optical depth (tau) for each model
+        KuruczDataset.calculate_tau(model)
+        
+        shape = (len(PROFILE_KEYS), num_models, depth)
+        if shm_name is not None:
+            from multiprocessing.shared_memory import SharedMemory
+            shm = SharedMemory(name=shm_name)
+            try:
+                profiles = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                for i, key in enumerate(PROFILE_KEYS):
+                    _pad_into(profiles[i, row], model[key])
+                del profiles  # release the buffer before closing the block
+            finally:
+                shm.close()
+        else:
+            profiles = np.memmap(memmap_path, dtype=np.float32, mode='r+', shape=shape)
+            for i, key in enumerate(PROFILE_KEYS):
+                _pad_into(profiles[i, row], model[key])
+            profiles.flush()
+            del profiles
+        
+        # Drop the bulk arrays so they are not pickled back to the parent
+        for key in PROFILE_KEYS + ['VTURB', 'extra_columns']:
+            model.pop(key, None)
+        return model
+    except Exception as e:
+        print(f"Error loading {file_path}: {e}")
+        return None
+
+
+def _shared_memory_fits(nbytes):
+    """
+    Check whether a POSIX shared-memory block of `nbytes` can be used.
+    
+    multiprocessing.shared_memory needs Python >= 3.8, and on Linux the block lives in
+    /dev/shm, which is often small in containers (64 MB by default in Docker); writing
+    past its free space kills the workers with SIGBUS instead of raising.
+    """
+    try:
+        from multiprocessing.shared_memory import SharedMemory
+    except ImportError:
+        return False
+    if os.path.isdir('/dev/shm'):
+        stats = os.statvfs('/dev/shm')
+        return stats.f_bavail * stats.f_frsize >= nbytes
+    return True
+
+
+def _load_models(file_paths, depth):
+    """
+    Load all model files in parallel and gather their padded depth profiles.
+    
+    Workers write the profiles straight into a shared buffer and only return the model
+    headers, so the bulk data is never pickled. The buffer is a shared-memory block when
+    it fits, otherwise a memory-mapped temporary file.
+    
+    Parameters:
+        file_paths (list): Paths of the model files
+        depth (int): Number of depth points to pad or truncate each profile to
+        
+    Returns:
+        tuple: (models, profiles) where models is the list of loaded header dicts and profiles
+               is a float32 array of shape (len(PROFILE_KEYS), len(models), depth)
+    """
+    num_files = len(file_paths)
+    shape = (len(PROFILE_KEYS), num_files, depth)
+    nbytes = int(np.prod(shape)) * 4
+    if nbytes == 0:
+        return [], np.empty((len(PROFILE_KEYS), 0, depth), dtype=np.float32)
+    
+    shm = None
+    memmap_path = None
+    if _shared_memory_fits(nbytes):
+        from multiprocessing.shared_memory import SharedMemory
+        shm = SharedMemory(create=True, size=nbytes)
+        load_one = partial(_load_one, num_models=num_files, depth=depth, shm_name=shm.name)
+    else:
+        fd, memmap_path = tempfile.mkstemp(suffix='.profiles')
+        os.close(fd)
+        np.memmap(memmap_path, dtype=np.float32, mode='w+', shape=shape).flush()
+        load_one = partial(_load_one, num_models=num_files, depth=depth, memmap_path=memmap_path)
+    
+    try:
+        # Parsing is CPU-bound and independent per file
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 16)) as executor:
+            results = list(executor.map(load_one, file_paths, range(num_files), chunksize=8))
+        
+        models = [model for model in results if model is not None]
+        loaded = np.array([model is not None for model in results], dtype=bool)
+        
+        # Boolean indexing copies the loaded rows out of the buffer before it is released
+        if shm is not None:
+            shared_profiles = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        else:
+            shared_profiles = np.memmap(memmap_path, dtype=np.float32, mode='r', shape=shape)
+        profiles = np.ascontiguousarray(shared_profiles[:, loaded])
+        del shared_profiles
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        else:
+            os.remove(memmap_path)
+    
+    return models, profiles
+
+
 class KuruczDataset(Dataset):
     """
     Dataset for Kurucz stellar atmosphere models with standardized [-1, 1] normalization.
@@ -185,11 +352,21 @@ class KuruczDataset(Dataset):
         file_pattern (str): Glob pattern to match model files (default: '*.atm')
         max_depth_points (int): Maximum number of depth points to include (default: 80)
         device (str): Device to store tensors on ('cpu' or 'cuda', default: 'cpu')
+        sample_dtype (torch.dtype): Storage dtype of the normalized data (the precomputed sample
+                                    tensors and the per-parameter views into them). Values lie in
+                                    [-1, 1], so torch.float16 halves this copy; samples are returned
+                                    as float32 either way. The unnormalized `original` tensors stay
+                                    float32 (default: torch.float32)
     """
-    def __init__(self, data_dir, file_pattern='*.atm', max_depth_points=80, device='cpu'):
+    # Order of the atmospheric parameters along the last axis of the model outputs
+    output_columns = ['RHOX', 'T', 'P', 'XNE', 'ABROSS', 'ACCRAD']
+    
+    def __init__(self, data_dir, file_pattern='*.atm', max_depth_points=80, device='cpu',
+                 sample_dtype=torch.float32):
         self.data_dir = data_dir
         self.max_depth_points = max_depth_points
         self.device = device
+        self.sample_dtype = sample_dtype
         self.norm_params = {}
         
         # Handle both single directory and list of directories
@@ -202,16 +379,8 @@ class KuruczDataset(Dataset):
             # Single directory case (original behavior)
             self.file_paths = glob.glob(os.path.join(data_dir, file_pattern))
         
-        # Load and process all files
-        self.models = []
-        for file_path in self.file_paths:
-            try:
-                model = read_kurucz_model(file_path)
-                # Calculate optical depth (tau) for each model
-                self.calculate_tau(model)
-                self.models.append(model)
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
+        # Load and process all files in parallel
+        self.models, self._profiles = _load_models(self.file_paths, max_depth_points)
         
         if len(self.models) == 0:
             if isinstance(data_dir, list):
@@ -228,8 +397,17 @@ class KuruczDataset(Dataset):
         
         # Apply normalization to all data
         self.normalize_all_data()
+        
+        # Assemble the per-sample input/output tensors once
+        self.build_sample_tensors()
+        
+        # The parsed models are no longer needed once the tensors exist; release them
+        # (matches the empty models list of datasets restored by load_dataset_file)
+        self.models = []
+        gc.collect()
 
-    def calculate_tau(self, model):
+    @staticmethod
+    def calculate_tau(model):
         """
         Calculate optical depth (tau) for a model by integrating opacity over mass column density.
         
@@ -240,85 +418,44 @@ class KuruczDataset(Dataset):
             None: Adds 'TAU' key to the model dictionary
         """
         # Get the mass column density (RHOX) and opacity (ABROSS)
-        rhox = np.array(model['RHOX'])
-        abross = np.array(model['ABROSS'])
-        
-        # Initialize tau array
-        tau = np.zeros_like(rhox)
+        rhox = np.asarray(model['RHOX'], dtype=np.float64)
+        abross = np.asarray(model['ABROSS'], dtype=np.float64)
         
         # The Kurucz models are typically ordered from the outer atmosphere (low density)
         # to the inner atmosphere (high density), so we integrate from outside in
-        for i in range(1, len(rhox)):
-            # Calculate the increment in tau using the trapezoidal rule
-            delta_rhox = rhox[i] - rhox[i-1]
-            avg_opacity = (abross[i] + abross[i-1]) / 2.0
-            delta_tau = avg_opacity * delta_rhox
-            
-            # Add to the cumulative tau
-            tau[i] = tau[i-1] + delta_tau
+        # using the cumulative trapezoidal rule
+        tau = np.empty_like(rhox)
+        tau[0] = 0.0
+        np.cumsum(0.5 * (abross[1:] + abross[:-1]) * np.diff(rhox), out=tau[1:])
         
         # Store tau in the model
-        model['TAU'] = tau.tolist()
+        model['TAU'] = tau
         
         return None
 
     def prepare_data(self):
         """Prepare data tensors from the loaded models"""
+        num_models = len(self.models)
+        
         # Input features: teff, gravity, feh, afe
-        self.teff_list = []
-        self.gravity_list = []
-        self.feh_list = []
-        self.afe_list = []
-        
-        # Output features: RHOX, T, P, XNE, ABROSS, ACCRAD, TAU
-        self.rhox_list = []
-        self.t_list = []
-        self.p_list = []
-        self.xne_list = []
-        self.abross_list = []
-        self.accrad_list = []
-        self.tau_list = []  # Add tau list
-        
-        # Process each model
-        for model in self.models:
-            # Pad or truncate depth profiles to max_depth_points
-            rhox = self.pad_sequence(model['RHOX'], self.max_depth_points)
-            t = self.pad_sequence(model['T'], self.max_depth_points)
-            p = self.pad_sequence(model['P'], self.max_depth_points)
-            xne = self.pad_sequence(model['XNE'], self.max_depth_points)
-            abross = self.pad_sequence(model['ABROSS'], self.max_depth_points)
-            accrad = self.pad_sequence(model['ACCRAD'], self.max_depth_points)
-            tau = self.pad_sequence(model['TAU'], self.max_depth_points)  # Add tau
-            
-            # Store input parameters
-            self.teff_list.append(model['teff'])
-            self.gravity_list.append(model['gravity'])
-            self.feh_list.append(model['feh'] if model['feh'] is not None else 0.0)
-            self.afe_list.append(model['afe'] if model['afe'] is not None else 0.0)
-            
-            # Store output parameters
-            self.rhox_list.append(rhox)
-            self.t_list.append(t)
-            self.p_list.append(p)
-            self.xne_list.append(xne)
-            self.abross_list.append(abross)
-            self.accrad_list.append(accrad)
-            self.tau_list.append(tau)  # Add tau
-        
-        # Convert to tensors
-        self.original = {
-            'teff': torch.tensor(self.teff_list, dtype=torch.float32, device=self.device).unsqueeze(1),
-            'gravity': torch.tensor(self.gravity_list, dtype=torch.float32, device=self.device).unsqueeze(1),
-            'feh': torch.tensor(self.feh_list, dtype=torch.float32, device=self.device).unsqueeze(1),
-            'afe': torch.tensor(self.afe_list, dtype=torch.float32, device=self.device).unsqueeze(1),
-            'RHOX': torch.tensor(self.rhox_list, dtype=torch.float32, device=self.device),
-            'T': torch.tensor(self.t_list, dtype=torch.float32, device=self.device),
-            'P': torch.tensor(self.p_list, dtype=torch.float32, device=self.device),
-            'XNE': torch.tensor(self.xne_list, dtype=torch.float32, device=self.device),
-            'ABROSS': torch.tensor(self.abross_list, dtype=torch.float32, device=self.device),
-            'ACCRAD': torch.tensor(self.accrad_list, dtype=torch.float32, device=self.device),
-            'TAU': torch.tensor(self.tau_list, dtype=torch.float32, device=self.device)  # Add tau
-        }
+        scalar_keys = ['teff', 'gravity', 'feh', 'afe']
+        
+        # Preallocate one contiguous array per field and fill it row by row
+        scalars = {key: np.empty((num_models, 1), dtype=np.float32) for key in scalar_keys}
+        for i, model in enumerate(self.models):
+            # Store input parameters ([Fe/H] and [α/Fe] default to 0 when missing)
+            for key in scalar_keys:
+                scalars[key][i] = model[key] if model[key] is not None else 0.0
+        
+        # Output features: the depth profiles were already padded to max_depth_points by
+        # the loader workers, one contiguous (num_models, max_depth_points) slab per field
+        profiles = {key: self._profiles[i] for i, key in enumerate(PROFILE_KEYS)}
+        del self._profiles
+        
+        # Convert to tensors (from_numpy shares memory, so no list-of-lists conversion)
+        self.original = {}
+        for key, array in list(scalars.items()) + list(profiles.items()):
+            self.original[key] = torch.from_numpy(array).to(self.device)
 
     def setup_normalization(self):
         """Calculate normalization parameters for each feature"""
@@ -326,29 +463,50 @@ class KuruczDataset(Dataset):
         # 2025.05.27: T should be log
         log_params = ['teff', 'RHOX', 'P', 'XNE', 'ABROSS', 'ACCRAD', 'TAU', 'T']
         
+        # Group parameters by shape (stellar parameters vs. depth profiles) so each group
+        # needs a single stacked log transform and one min/max reduction
+        groups = {}
         for param_name, data in self.original.items():
-            if param_name in log_params:
-                transformed_data = torch.log10(data + 1e-30)
-                log_scale = True
-            else:
-                transformed_data = data
-                log_scale = False
+            groups.setdefault(tuple(data.shape), []).append(param_name)
+        
+        param_ranges = {}
+        for names in groups.values():
+            stacked = torch.stack([self.original[name] for name in names])  # (F, N, ...)
+            log_mask = torch.tensor([name in log_params for name in names], device=stacked.device)
+            log_mask = log_mask.view(-1, *([1] * (stacked.dim() - 1)))
+            transformed_data = torch.where(log_mask, torch.log10(stacked + 1e-30), stacked)
             
-            # 新增 scale 计算
-            if transformed_data.dim() > 2:
-                param_min = transformed_data.min(dim=0).values
-                param_max = transformed_data.max(dim=0).values
+            # 新增 scale 计算: per-depth ranges for >2D data, global ranges otherwise
+            if stacked.dim() > 3:
+                reduce_dims = (1,)
             else:
-                param_min = transformed_data.min()
-                param_max = transformed_data.max()
+                reduce_dims = tuple(range(1, stacked.dim()))
+            param_min = transformed_data.amin(dim=reduce_dims)
+            param_max = transformed_data.amax(dim=reduce_dims)
             
-            # 显式存储 scale = (max - min)/2
-            self.norm_params[param_name] = {
+            for i, name in enumerate(names):
+                param_ranges[name] = (param_min[i], param_max[i])
+        
+        for param_name in self.original:
+            param_min, param_max = param_ranges[param_name]
+            # 显式存储 scale = (max - min)/2，以及 normalize/denormalize 使用的仿射系数
+            self.norm_params[param_name] = _add_affine_terms({
                 'min': param_min,
                 'max': param_max,
-                'scale': (param_max - param_min) / 2.0,  # 新增关键字段
-                'log_scale': log_scale
-            }
+                'log_scale': param_name in log_params
+            })
+        
+        # Stack the output coefficients for vectorized inverse transforms
+        self.build_output_transform()
+    
+    def build_output_transform(self):
+        """Stack the output parameters' normalization coefficients along a trailing feature axis"""
+        params = [self.norm_params[name] for name in self.output_columns]
+        # Log-scaled columns use the ln-scaled coefficients so they can be inverted with exp
+        self._out_scale = torch.stack([p['ln_scale'] if p['log_scale'] else p['scale'] for p in params], dim=-1)
+        self._out_offset = torch.stack([p['ln_offset'] if p['log_scale'] else p['offset'] for p in params], dim=-1)
+        self._out_log_mask = torch.tensor([p['log_scale'] for p in params], dtype=torch.bool,
+                                          device=self._out_scale.device)
             
     def normalize_all_data(self):
         """Apply normalization to all data tensors"""
@@ -380,14 +538,12 @@ class KuruczDataset(Dataset):
         """
         params = self.norm_params[param_name]
         
-        # Apply log transform if needed
+        # Apply log transform if needed and min-max scaling to [-1, 1] range as a single
+        # fused multiply-add (the log10 base change is folded into ln_inv_range)
         if params['log_scale']:
-            transformed_data = torch.log10(data + 1e-30)
+            normalized = torch.addcmul(params['shift'], torch.log(data + 1e-30), params['ln_inv_range'])
         else:
-            transformed_data = data
-        
-        # Apply min-max scaling to [-1, 1] range
-        normalized = 2.0 * (transformed_data - params['min']) / (params['max'] - params['min']) - 1.0
+            normalized = torch.addcmul(params['shift'], data, params['inv_range'])
         
         return normalized
 
@@ -404,29 +560,84 @@ class KuruczDataset(Dataset):
         """
         params = self.norm_params[param_name]
         
-        # Reverse min-max scaling from [-1, 1] range
-        transformed_data = (normalized_data + 1.0) / 2.0 * (params['max'] - params['min']) + params['min']
+        # Undo in FP32 even if the model ran under bf16 autocast, so the exp below keeps its range
+        normalized_data = normalized_data.float()
         
-        # Reverse log transform if needed
+        # Reverse min-max scaling from [-1, 1] range, then the log transform if needed
+        # (exp of the ln-scaled coefficients is 10**x without going through pow)
         if params['log_scale']:
-            denormalized_data = torch.pow(10.0, transformed_data) - 1e-30
+            denormalized_data = torch.exp(torch.addcmul(params['ln_offset'], normalized_data, params['ln_scale'])) - 1e-30
         else:
-            denormalized_data = transformed_data
+            denormalized_data = torch.addcmul(params['offset'], normalized_data, params['scale'])
         
         # Ensure gradient propagation is maintained and data stays on the correct device
         return denormalized_data.to(self.device)
 
     def pad_sequence(self, values, target_length):
         """Pad a sequence to the target length"""
-        if len(values) >= target_length:
-            return values[:target_length]
+        padded = np.empty(target_length, dtype=np.float32)
+        _pad_into(padded, values)
+        return padded
+    
+    def build_sample_tensors(self):
+        """
+        Precompute the model input and output tensors for every sample.
+        
+        Stores (in self.sample_dtype):
+            _X: tensor of shape (N, 4+max_depth_points) with [teff, logg, feh, afe, tau_1, ..., tau_D]
+            _Y: tensor of shape (N, max_depth_points, 6) with [RHOX, T, P, XNE, ABROSS, ACCRAD]
+        
+        The per-parameter normalized tensors (self.teff ... self.TAU) are then rebound to
+        views of _X/_Y, so the normalized data is held only once.
+        """
+        stellar_params = torch.cat([self.teff, self.gravity, self.feh, self.afe], dim=1)  # (N, 4)
+        # Materialize row-major so batches gathered from _X feed the first Linear without a repack
+        self._X = torch.cat([stellar_params, self.TAU], dim=1).to(self.sample_dtype).contiguous()
+        self._Y = torch.stack([
+            self.RHOX,
+            self.T,
+            self.P,
+            self.XNE,
+            self.ABROSS,
+            self.ACCRAD
+        ], dim=-1).to(self.sample_dtype).contiguous()
+        
+        # Release the separate per-parameter copies in favour of views into _X/_Y
+        self.teff, self.gravity, self.feh, self.afe = (self._X[:, i:i + 1] for i in range(4))
+        self.TAU = self._X[:, 4:]
+        for i, param_name in enumerate(self.output_columns):
+            setattr(self, param_name, self._Y[..., i])
+    
+    def iter_batches(self, batch_size, shuffle=True, indices=None):
+        """
+        Yield (inputs, outputs) mini-batches straight from the precomputed tensors.
+        
+        Gathers rows on the tensors' own device, which avoids DataLoader's per-sample
+        fetch and collate when the data already lives on the GPU.
+        
+        Parameters:
+            batch_size (int): Number of samples per batch
+            shuffle (bool): Whether to draw the samples in a random order
+            indices (sequence of int, optional): Subset of sample indices to iterate over
+        
+        Yields:
+            tuple: (inputs, outputs) batches of shape (B, 4+max_depth_points) and (B, max_depth_points, 6)
+        """
+        device = self._X.device
+        if indices is None:
+            indices = torch.arange(len(self), device=device)
+        else:
+            indices = torch.as_tensor(indices, dtype=torch.long, device=device)
+        
+        if shuffle:
+            indices = indices[torch.randperm(len(indices), device=device)]
         
-        # Pad with the last value
-        padding_needed = target_length - len(values)
-        return values + [values[-1]] * padding_needed
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            yield self._X[batch].float(), self._Y[batch].float()
     
     def __len__(self):
-        return len(self.teff)
+        return self._X.shape[0]
     
     def __getitem__(self, idx):
         """
@@ -440,31 +651,9 @@ class KuruczDataset(Dataset):
                                 atmospheric parameters [RHOX, T, P, XNE, ABROSS, ACCRAD]
                                 for each depth point
         """
-        # Get stellar parameters
-        stellar_params = torch.cat([
-            self.teff[idx],
-            self.gravity[idx],
-            self.feh[idx],
-            self.afe[idx]
-        ], dim=0).flatten()  # Flatten to handle both single item and batch cases
-        
-        # Get the tau values
-        tau = self.TAU[idx]
-        
-        # Concatenate stellar parameters with tau values to form input
-        input_features = torch.cat([stellar_params, tau])
-        
-        # Output features - atmospheric parameters for each depth point
-        output_features = torch.stack([
-            self.RHOX[idx],
-            self.T[idx],
-            self.P[idx],
-            self.XNE[idx],
-            self.ABROSS[idx],
-            self.ACCRAD[idx]
-        ], dim=1)
-        
-        return input_features, output_features
+        # Both are views into the precomputed tensors, so no per-item allocation
+        # (.float() only copies when the samples are stored in reduced precision)
+        return self._X[idx].float(), self._Y[idx].float()
     
     def inverse_transform_inputs(self, inputs):
         """Transform normalized inputs back to physical units"""
@@ -496,68 +685,55 @@ class KuruczDataset(Dataset):
     
     def inverse_transform_outputs(self, outputs):
         """Transform normalized outputs back to physical units"""
-        batch_size, num_features = outputs.shape[:2]
-        
-        # Initialize containers for denormalized data
-        result = {
-            'RHOX': None,
-            'T': None,
-            'P': None,
-            'XNE': None,
-            'ABROSS': None,
-            'ACCRAD': None
-        }
-        
-        # Get column names
-        columns = list(result.keys())
-        
-        # Denormalize each feature
-        for i, param_name in enumerate(columns):
-            # Extract the i-th feature for all samples and depths
-            feature_data = outputs[:, :, i] if outputs.dim() > 2 else outputs[:, i]
-            # Denormalize
-            result[param_name] = self.denormalize(param_name, feature_data)
-        
-        return result
+        if outputs.dim() <= 2:
+            # Per-feature fallback for outputs without a depth axis
+            return {param_name: self.denormalize(param_name, outputs[:, i])
+                    for i, param_name in enumerate(self.output_columns)}
+        
+        # Denormalize all features of the (batch, depth, feature) tensor at once
+        transformed = torch.addcmul(self._out_offset, outputs.float(), self._out_scale)
+        denormalized = torch.where(self._out_log_mask, torch.exp(transformed) - 1e-30, transformed)
+        denormalized = denormalized.to(self.device)
+        
+        # Split into per-parameter views
+        return {param_name: denormalized[..., i] for i, param_name in enumerate(self.output_columns)}
 
 
-def save_dataset(dataset, filepath):
+def save_dataset(dataset, filepath, include_original=False):
     """
     Save the KuruczDataset to a file.
     
     Parameters:
         dataset: KuruczDataset instance to save
         filepath (str): Path where to save the dataset
+        include_original (bool): Also store the unnormalized data. It roughly doubles the
+                                 file size and can be recovered from norm_params on load
+                                 (default: False)
     """
+    data = {
+        key: getattr(dataset, key).float().contiguous().cpu()
+        for key in ['teff', 'gravity', 'feh', 'afe', 'RHOX', 'T', 'P', 'XNE', 'ABROSS', 'ACCRAD', 'TAU']
+    }
+    if include_original:
+        data['original'] = {k: v.contiguous().cpu() for k, v in dataset.original.items()}
+    
     save_dict = {
         'norm_params': dataset.norm_params,
         'max_depth_points': dataset.max_depth_points,
-        'data': {
-            'teff': dataset.teff,
-            'gravity': dataset.gravity,
-            'feh': dataset.feh,
-            'afe': dataset.afe,
-            'RHOX': dataset.RHOX,
-            'T': dataset.T,
-            'P': dataset.P,
-            'XNE': dataset.XNE,
-            'ABROSS': dataset.ABROSS,
-            'ACCRAD': dataset.ACCRAD,
-            'TAU': dataset.TAU,
-            'original': dataset.original
-        }
+        'data': data
     }
     torch.save(save_dict, filepath)
     print(f"Dataset saved to {filepath}")
 
 
-def load_dataset_file(filepath, device='cpu'):
+def load_dataset_file(filepath, device='cpu', sample_dtype=torch.float32):
     """
     Load a saved dataset.
     
     Parameters:
         filepath (str): Path to the saved dataset
         device (str): Device to load the data to ('cpu' or 'cuda')
+        sample_dtype (torch.dtype): Storage dtype of the precomputed sample tensors
         
     Returns:
         KuruczDataset: Loaded dataset
@@ -565,13 +741,25 @@ def load_dataset_file(filepath, device='cpu'):
     # Create an empty dataset
     dataset = KuruczDataset.__new__(KuruczDataset)
     
-    # Load the saved data
-    save_dict = torch.load(filepath, map_location=device)
+    # Memory-map the saved data so pages are only read when touched (PyTorch >= 2.1);
+    # older PyTorch versions and legacy (non-zipfile) saves fall back to a regular load
+    try:
+        save_dict = torch.load(filepath, map_location='cpu', mmap=True)
+    except (TypeError, RuntimeError):
+        save_dict = torch.load(filepath, map_location='cpu')
     
     # Restore attributes
-    dataset.norm_params = save_dict['norm_params']
+    dataset.norm_params = {
+        name: {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in params.items()}
+        for name, params in save_dict['norm_params'].items()
+    }
+    for params in dataset.norm_params.values():
+        # Recompute the cached coefficients so files saved by older versions get them too
+        _add_affine_terms(params)
+    dataset.build_output_transform()
     dataset.max_depth_points = save_dict['max_depth_points']
     dataset.device = device
+    dataset.sample_dtype = sample_dtype
     
     # Move data to the specified device
     for key, value in save_dict['data'].items():
@@ -580,30 +768,66 @@ def load_dataset_file(filepath, device='cpu'):
             original_dict = {}
             for k, v in value.items():
                 if isinstance(v, torch.Tensor):
-                    original_dict[k] = v.to(device)
+                    original_dict[k] = v.to(device, non_blocking=True)
                 else:
                     original_dict[k] = v
             setattr(dataset, key, original_dict)
         else:
             # Normal tensor values
-            setattr(dataset, key, value.to(device))
+            setattr(dataset, key, value.to(device, non_blocking=True))
+    
+    # Files saved without the unnormalized data: recover it from the normalization parameters
+    if 'original' not in save_dict['data']:
+        dataset.original = {
+            name: dataset.denormalize(name, getattr(dataset, name)) for name in dataset.norm_params
+        }
     
     # Initialize empty models list (not needed after loading)
     dataset.models = []
     
+    # Rebuild the per-sample tensors from the normalized data
+    dataset.build_sample_tensors()
+    
     return dataset
 
 
-def create_dataloader_from_saved(filepath, batch_size=32, num_workers=4, device='cpu', validation_split=0.1):
+class DeviceBatchLoader:
+    """
+    Minimal DataLoader replacement for datasets whose tensors already live on the target device.
+    
+    Parameters:
+        subset (torch.utils.data.Subset): Subset of a KuruczDataset to iterate over
+        batch_size (int): Number of samples per batch
+        shuffle (bool): Whether to reshuffle the samples every epoch
+    """
+    def __init__(self, subset, batch_size, shuffle=True):
+        self.dataset = subset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+    
+    def __iter__(self):
+        return self.dataset.dataset.iter_batches(
+            self.batch_size, shuffle=self.shuffle, indices=self.dataset.indices
+        )
+    
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+
+def create_dataloader_from_saved(filepath, batch_size=32, num_workers=4, device='cpu', validation_split=0.1,
+                                 sample_dtype=torch.float32):
     """
     Create train and validation DataLoaders from a saved dataset.
     
+    When the data is loaded onto a GPU (or MPS), DeviceBatchLoader is returned instead of DataLoader.
+    
     Parameters:
         filepath (str): Path to the saved dataset
         batch_size (int): Batch size for the DataLoader
         num_workers (int): Number of worker processes for data loading
         device (str): Device to load the data to ('cpu' or 'cuda')
         validation_split (float): Fraction of data to use for validation
+        sample_dtype (torch.dtype): Storage dtype of the precomputed sample tensors
         
     Returns:
         tuple: (train_loader, val_loader, dataset)
@@ -611,7 +835,7 @@ def create_dataloader_from_saved(filepath, batch_size=32, num_workers=4, device=
     from torch.utils.data import DataLoader, random_split
     
     # Load the dataset
-    dataset = load_dataset_file(filepath, device)
+    dataset = load_dataset_file(filepath, device, sample_dtype)
     
     # Calculate split sizes
     dataset_size = len(dataset)
@@ -624,21 +848,24 @@ def create_dataloader_from_saved(filepath, batch_size=32, num_workers=4, device=
         dataset, [train_size, val_size], generator=generator
     )
     
-    # Create DataLoaders
-    train_loader = DataLoader(
-        train_dataset,
-        batch_size=batch_size,
-        shuffle=True,
-        num_workers=num_workers,
-        pin_memory=True if device=='cuda' else False
-    )
+    # Data loaded onto an accelerator is batched in place; DataLoader workers only
+    # help when the data (and therefore training) stays on the CPU
+    if torch.device(device).type != 'cpu':
+        train_loader = DeviceBatchLoader(train_dataset, batch_size, shuffle=True)
+        val_loader = DeviceBatchLoader(val_dataset, batch_size, shuffle=False)
+        return train_loader, val_loader, dataset
     
-    val_loader = DataLoader(
-        val_dataset,
-        batch_size=batch_size,
-        shuffle=False,
-        num_workers=num_workers,
-        pin_memory=True if device=='cuda' else False
-    )
+    loader_kwargs = {
+        'batch_size': batch_size,
+        'num_workers': num_workers,
+        'pin_memory': False  # batches stay on the CPU, so pinning would only add overhead
+    }
+    if num_workers > 0:
+        loader_kwargs['persistent_workers'] = True
+        loader_kwargs['prefetch_factor'] = 2
+    
+    # Create DataLoaders
+    train_loader = DataLoader(train_dataset, shuffle=True, **loader_kwargs)
+    val_loader = DataLoader(val_dataset, shuffle=False, **loader_kwargs)
     
     return train_loader, val_loader, dataset
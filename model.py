@@ -4,6 +4,7 @@ import torch
 from torch.utils.data import Dataset, DataLoader
 import torch.nn as nn
 import torch.nn.functional as F
+import copy
 import glob
 import numpy as np
 # =============================================================================
@@ -17,19 +18,17 @@ class AtmosphereNet(torch.nn.Module):
         self.output_size = output_size
         self.depth_points = depth_points
         
-        # Shared feature extractor for each depth point
-        self.feature_extractor = torch.nn.Sequential(
+        # Shared per-depth-point MLP (feature extractor followed by prediction layers),
+        # kept in a single Sequential so torch.compile can fuse it end to end
+        self.mlp = torch.nn.Sequential(
             torch.nn.Linear(input_size, hidden_size),
             torch.nn.ReLU(),
             torch.nn.Dropout(0.01),
             
             torch.nn.Linear(hidden_size, hidden_size),
             torch.nn.ReLU(),
-            torch.nn.Dropout(0.01)
-        )
-        
-        # Final prediction layers
-        self.output_layers = torch.nn.Sequential(
+            torch.nn.Dropout(0.01),
+            
             torch.nn.Linear(hidden_size, hidden_size),
             torch.nn.ReLU(),
             torch.nn.Dropout(0.01),
@@ -37,24 +36,42 @@ class AtmosphereNet(torch.nn.Module):
             torch.nn.Linear(hidden_size, output_size)
         )
         
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Map checkpoints saved with the old feature_extractor/output_layers split onto self.mlp
+        for key in list(state_dict.keys()):
+            for old_name, offset in (('feature_extractor.', 0), ('output_layers.', 6)):
+                if key.startswith(prefix + old_name):
+                    index, rest = key[len(prefix + old_name):].split('.', 1)
+                    state_dict[f"{prefix}mlp.{int(index) + offset}.{rest}"] = state_dict.pop(key)
+        super(AtmosphereNet, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+        
     def forward(self, x):
         # Input shape: (batch_size, depth_points, input_size)
-        batch_size, depth_points, _ = x.shape
-        
-        # Process each depth point independently
-        # Reshape to (batch_size * depth_points, input_size)
-        x_reshaped = x.reshape(-1, self.input_size)
-        
-        # Extract features for each depth point
-        features = self.feature_extractor(x_reshaped)
-        
-        # Generate predictions for each depth point
-        outputs = self.output_layers(features)
-        
-        # Reshape back to (batch_size, depth_points, output_size)
-        outputs = outputs.reshape(batch_size, depth_points, self.output_size)
-        
-        return outputs
+        # nn.Linear acts on the last dimension, so every depth point is processed
+        # independently without flattening; output shape: (batch_size, depth_points, output_size)
+        return self.mlp(x)
+
+    def export_inference(self):
+        """
+        Build a TorchScript copy of the network for repeated inference.
+        
+        Dropout layers are dropped (they are identities in eval mode), the remaining
+        Linear/ReLU stack is scripted, and on CPU the module is frozen and optimized.
+        The returned module takes inputs of shape (..., input_size), e.g.
+        (batch_size, depth_points, input_size), and returns (..., output_size).
+        
+        Returns:
+            torch.jit.ScriptModule: Inference-only copy of the network
+        """
+        layers = [copy.deepcopy(layer) for layer in self.mlp if not isinstance(layer, torch.nn.Dropout)]
+        inference_mlp = torch.nn.Sequential(*layers).eval()
+        
+        scripted = torch.jit.script(inference_mlp)
+        if next(self.parameters()).device.type == 'cpu':
+            # Freezing inlines the weights as constants so the CPU passes can fold them
+            scripted = torch.jit.optimize_for_inference(torch.jit.freeze(scripted))
+        
+        return scripted
 
 class AtmosphereNetMLP(torch.nn.Module):
     def __init__(self, input_size=5, hidden_size=256, output_size=6, depth_points=80):
@@ -8,6 +8,7 @@ import argparse
 import time
 import logging
 import math
+import contextlib
 from datetime import datetime
 from torch.utils.tensorboard import SummaryWriter
 from model import AtmosphereNet, AtmosphereNetMLP, AtmosphereNetMLPtau
@@ -86,7 +87,8 @@ def save_checkpoint(model, optimizer, scheduler, epoch, loss, filepath, logger):
     """Save model checkpoint"""
     torch.save({
         'epoch': epoch,
-        'model_state_dict': model.state_dict(),
+        # Unwrap torch.compile'd models so checkpoints keep the plain parameter names
+        'model_state_dict': getattr(model, '_orig_mod', model).state_dict(),
         'optimizer_state_dict': optimizer.state_dict(),
         'scheduler_state_dict': scheduler.state_dict() if scheduler else None,
         'loss': loss,
@@ -146,7 +148,13 @@ def load_checkpoint(model, optimizer, scheduler, checkpoint_path, device, logger
         logger.error(f"Error loading checkpoint: {str(e)}")
         raise
 
-def validate(model, dataloader, device, permute_inputs=False):
+def amp_context(use_amp):
+    """bf16 autocast on CUDA when AMP is enabled, otherwise a no-op context (plain FP32)"""
+    if use_amp:
+        return torch.autocast(device_type='cuda', dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+def validate(model, dataloader, device, permute_inputs=False, use_amp=False):
     """Validation loop for model evaluation with input permutation support"""
     model.eval()
     total_loss = 0
@@ -164,17 +172,18 @@ def validate(model, dataloader, device, permute_inputs=False):
                 inputs = inputs.permute(0, 2, 1)
             
             # Ensure tensors are contiguous before passing to the model
-            inputs = inputs.reshape(inputs.shape)
-            targets = targets.reshape(targets.shape)
+            inputs = inputs.contiguous()
+            targets = targets.contiguous()
             
             try:
-                outputs = model(inputs)
-                
-                # Skip batches with NaN outputs
-                if torch.isnan(outputs).any():
-                    continue
-                
-                loss, batch_param_losses = custom_loss(outputs, targets)
+                with amp_context(use_amp):
+                    outputs = model(inputs)
+                    
+                    # Skip batches with NaN outputs
+                    if torch.isnan(outputs).any():
+                        continue
+                    
+                    loss, batch_param_losses = custom_loss(outputs, targets)
                 
                 # Skip batches with NaN loss
                 if torch.isnan(loss) or torch.isinf(loss):
@@ -333,6 +342,11 @@ def train(model, train_loader, val_loader, optimizer, scheduler, device, start_e
     # Set train_loader attribute for scheduler creation
     args.train_loader = train_loader
     
+    # Mixed precision is only used on CUDA; bf16 keeps the FP32 exponent range so no GradScaler is needed
+    use_amp = args.amp and device.type == 'cuda'
+    if args.amp and not use_amp:
+        logger.warning("--amp requested but device is not CUDA, training in FP32")
+    
     # Initialize TensorBoard writer
     writer = SummaryWriter(os.path.join(args.log_dir, 'tensorboard'))
     
@@ -381,24 +395,26 @@ def train(model, train_loader, val_loader, optimizer, scheduler, device, start_e
                 inputs = inputs.permute(0, 2, 1)
             
             # Ensure tensors are contiguous before passing to the model
-            inputs = inputs.reshape(inputs.shape)
-            targets = targets.reshape(targets.shape)
+            inputs = inputs.contiguous()
+            targets = targets.contiguous()
             
             # Forward pass and loss calculation
             optimizer.zero_grad()
             
             # Catch any runtime errors in the forward pass
             try:
-                outputs = model(inputs)
-                
-                # Check for NaN values before loss calculation
-                if torch.isnan(outputs).any():
-                    logger.warning(f"NaN detected in outputs at epoch {epoch+1}, batch {batch_idx}")
-                    nan_batches += 1
-                    # Skip backprop for this batch
-                    continue
-                
-                loss, param_losses = custom_loss(outputs, targets)
+                # bf16 autocast runs the Linear layers on tensor cores; weights stay FP32
+                with amp_context(use_amp):
+                    outputs = model(inputs)
+                    
+                    # Check for NaN values before loss calculation
+                    if torch.isnan(outputs).any():
+                        logger.warning(f"NaN detected in outputs at epoch {epoch+1}, batch {batch_idx}")
+                        nan_batches += 1
+                        # Skip backprop for this batch
+                        continue
+                    
+                    loss, param_losses = custom_loss(outputs, targets)
                 
                 # Check if loss is NaN
                 if torch.isnan(loss) or torch.isinf(loss):
@@ -462,7 +478,7 @@ def train(model, train_loader, val_loader, optimizer, scheduler, device, start_e
         train_param_loss_str = ', '.join([f"{k}: {v:.6f}" for k, v in train_avg_param_losses.items()])
         
         # Validation phase
-        val_loss, val_param_losses = validate(model, val_loader, device, permute_inputs)
+        val_loss, val_param_losses = validate(model, val_loader, device, permute_inputs, use_amp)
         val_param_loss_str = ', '.join([f"{k}: {v:.6f}" for k, v in val_param_losses.items()])
         
         # Step for epoch-based schedulers
@@ -545,6 +561,9 @@ def main():
     # Hardware parameters
     parser.add_argument('--gpu', action='store_true', help='Use GPU if available')
     parser.add_argument('--num_workers', type=int, default=0, help='Number of worker processes for data loading')
+    parser.add_argument('--compile', action='store_true', help='Compile the model with torch.compile (PyTorch >= 2.0)')
+    parser.add_argument('--amp', action='store_true', help='Use bf16 autocast and TF32 matmuls on CUDA')
+    parser.add_argument('--half_samples', action='store_true', help='Store the normalized dataset tensors as float16 (the unnormalized copy stays float32)')
     
     # Learning rate scheduler parameters
     parser.add_argument('--scheduler', type=str, default='plateau', 
@@ -591,6 +610,12 @@ def main():
         device = torch.device('cpu')
     logger.info(f"Using device: {device}")
     
+    # Allow TF32 tensor-core matmuls for the FP32 parts of the model
+    if args.amp and device.type == 'cuda':
+        torch.backends.cuda.matmul.allow_tf32 = True
+        if hasattr(torch, 'set_float32_matmul_precision'):
+            torch.set_float32_matmul_precision('high')
+    
     # Log training configuration
     logger.info("Training configuration:")
     for arg in vars(args):
@@ -602,9 +627,10 @@ def main():
         train_loader, val_loader, dataset = create_dataloader_from_saved(
             filepath=args.dataset,
             batch_size=args.batch_size,
-            num_workers=0,
+            num_workers=args.num_workers,
             device=device,
-            validation_split=args.validation_split
+            validation_split=args.validation_split,
+            sample_dtype=torch.float16 if args.half_samples else torch.float32
         )
         logger.info(f"Dataset loaded, {len(dataset)} total samples, "
                   f"{len(train_loader.dataset)} training, {len(val_loader.dataset)} validation")
@@ -684,6 +710,14 @@ def main():
             logger.error(f"Failed to load checkpoint: {str(e)}. Starting from scratch.")
             start_epoch = 0
     
+    # Compile after any checkpoint is loaded so parameter names still match
+    if args.compile:
+        if hasattr(torch, 'compile'):
+            model = torch.compile(model)
+            logger.info("Compiled model with torch.compile")
+        else:
+            logger.warning("torch.compile is not available in this PyTorch version, running eagerly")
+    
     # Train the model
     try:
         train(model, train_loader, val_loader, optimizer, scheduler, device, start_epoch, args, logger)